@@ -1,12 +1,24 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from concurrent.futures import Future
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import joblib
+import logging
 import numpy as np
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 import sys
 import traceback
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -14,10 +26,31 @@ CORS(app)  # Enable CORS for all routes
 # --- Configuration ---
 PORT = int(os.environ.get("PORT", 10000))
 MODEL_FILE = "rf_model_maize_maturity.pkl"
+BATCH_MAX = 32       # max requests folded into one model.predict call
+BATCH_WAIT = 0.005   # seconds to wait for more requests before predicting
+PREDICT_TIMEOUT = 2.0
+
+# --- Logging ---
+# Per-request logging goes through an in-memory queue so the request thread
+# never blocks on a stdout lock or disk flush; a listener thread drains the
+# queue into a rotating file. Successful predictions log at DEBUG only, so
+# the production default (WARNING) keeps the hot path print-free. The queue,
+# handler and listener are built per process in init_worker(): a listener
+# started at import would survive only in the gunicorn arbiter after fork,
+# leaving workers enqueueing records nobody drains.
+logger = logging.getLogger("predict")
+logger.setLevel(os.environ.get("LOG_LEVEL", "WARNING"))
+_log_listener = None
 
 # --- Model Loading with Error Handling ---
-model = None
-try:
+@lru_cache(maxsize=1)
+def get_model():
+    """Load the RandomForest exactly once per process.
+
+    The lru_cache guard makes the load a singleton: any module that
+    imports this one (or calls get_model directly) shares the same
+    forest instead of triggering another multi-MB joblib.load.
+    """
     # Verify model file exists before loading
     if not os.path.exists(MODEL_FILE):
         raise FileNotFoundError(f"Model file {MODEL_FILE} not found")
@@ -25,7 +58,15 @@ try:
     if os.path.getsize(MODEL_FILE) == 0:
         raise ValueError("Model file is empty")
 
-    model = joblib.load(MODEL_FILE)
+    # mmap_mode='r' keeps the tree arrays in the page cache as read-only
+    # mappings, so forked gunicorn workers share them instead of each
+    # holding a private copy
+    return joblib.load(MODEL_FILE, mmap_mode="r")
+
+
+model = None
+try:
+    model = get_model()
     print(f"✅ Model loaded successfully from {MODEL_FILE}")
     print(f"Model type: {type(model)}")
 
@@ -35,27 +76,359 @@ except Exception as e:
     model = None
 
 
+# --- Compiled Predictor (optional) ---
+# Treelite compiles the forest to native code with vectorized tree walks,
+# replacing sklearn's interpreted per-tree predict path. Falls back to the
+# sklearn model when treelite is not installed or compilation fails.
+TREELITE_LIB = "./rf_compiled.so"
+treelite_predictor = None
+if model is not None:
+    try:
+        import treelite
+        import treelite_runtime
+
+        if not os.path.exists(TREELITE_LIB):
+            tl_model = treelite.sklearn.import_model(model)
+            tl_model.export_lib(
+                toolchain="gcc",
+                libpath=TREELITE_LIB,
+                params={"parallel_comp": 4, "quantize": 1},
+            )
+        # nthread=1: the predictor runs in the arbiter pre-fork (warm grid)
+        # and libgomp's thread pool is not fork-safe; batches are at most
+        # BATCH_MAX rows anyway, same rationale as the serial numba kernel
+        treelite_predictor = treelite_runtime.Predictor(TREELITE_LIB, nthread=1)
+        print(f"✅ Treelite predictor compiled to {TREELITE_LIB}")
+    except ImportError:
+        print("ℹ️ treelite not installed, using sklearn predict")
+    except Exception as e:
+        print(f"⚠️ Treelite compilation failed, using sklearn predict: {e}",
+              file=sys.stderr)
+        treelite_predictor = None
+
+
+# --- Flat Tree Tables (vectorized numpy tree walk) ---
+# Structure-of-arrays copy of the forest: one (n_trees, max_nodes) table per
+# node attribute, so each depth level of the walk is a handful of numpy
+# gathers instead of per-tree Python object traversal. Loaded from the
+# quantized export when quantize_model.py has been run, else built from the
+# pickled estimators at startup.
+QUANTIZED_FILE = "rf_model_maize_maturity_q.npz"
+tree_tables = None
+if model is not None:
+    try:
+        from quantize_model import extract_tables
+
+        if os.path.exists(QUANTIZED_FILE):
+            with np.load(QUANTIZED_FILE) as npz:
+                tree_tables = {k: npz[k] for k in npz.files}
+            print(f"✅ Flat tree tables loaded from {QUANTIZED_FILE}")
+        else:
+            tree_tables = extract_tables(model)
+            print("✅ Flat tree tables built from the pickled forest")
+    except Exception as e:
+        print(f"⚠️ Flat tree tables unavailable, using sklearn predict: {e}",
+              file=sys.stderr)
+        tree_tables = None
+
+
+# Numba-compiled per-row walk (optional). Batching amortizes sklearn's
+# dispatch overhead but does nothing for a cache-miss batch of one; the
+# JIT walk removes the Python overhead from that case too, and prange
+# scales larger batches across cores.
+_numba_walk = None
+if tree_tables is not None:
+    try:
+        from numba import njit
+
+        # float16 leaf values are not supported in nopython mode
+        _nb_value = tree_tables["value"].astype(np.float32)
+
+        # Serial on purpose: batches are at most BATCH_MAX rows, where
+        # prange gains nothing, and numba's parallel runtime does not
+        # survive the gunicorn preload fork
+        @njit(cache=True)
+        def _numba_walk(X, feat, thr, left, right, value):
+            n_rows = X.shape[0]
+            n_trees = feat.shape[0]
+            n_classes = value.shape[2]
+            out = np.empty((n_rows, n_classes), dtype=np.float32)
+            for i in range(n_rows):
+                acc = np.zeros(n_classes, dtype=np.float32)
+                for t in range(n_trees):
+                    n = 0
+                    while left[t, n] != -1:
+                        if X[i, feat[t, n]] <= thr[t, n]:
+                            n = left[t, n]
+                        else:
+                            n = right[t, n]
+                    acc += value[t, n]
+                out[i] = acc / n_trees
+            return out
+
+        # Warm the JIT so the first request doesn't pay compile time
+        _numba_walk(
+            np.zeros((1, 5), dtype=np.float32),
+            tree_tables["feature"], tree_tables["threshold"],
+            tree_tables["children_left"], tree_tables["children_right"],
+            _nb_value,
+        )
+        print("✅ Numba tree walk compiled")
+    except ImportError:
+        print("ℹ️ numba not installed, using numpy tree walk")
+        _numba_walk = None
+    except Exception as e:
+        print(f"⚠️ Numba compilation failed, using numpy tree walk: {e}",
+              file=sys.stderr)
+        _numba_walk = None
+
+
+def _tables_predict_proba(X):
+    """Level-synchronous tree walk over the flat tables.
+
+    All trees advance one depth level per iteration: gather the split
+    feature/threshold for every (tree, row) pair, compare, and step to the
+    left or right child. Rows already at a leaf stay put.
+    """
+    feat = tree_tables["feature"]
+    thr = tree_tables["threshold"]
+    left = tree_tables["children_left"]
+    right = tree_tables["children_right"]
+    value = tree_tables["value"]
+
+    n_trees = feat.shape[0]
+    n_rows = X.shape[0]
+    tree_idx = np.arange(n_trees)[:, None]
+    row_idx = np.arange(n_rows)[None, :]
+    nodes = np.zeros((n_trees, n_rows), dtype=np.int32)
+    for _ in range(int(tree_tables["max_depth"])):
+        f = feat[tree_idx, nodes]               # (T, N) split features
+        at_leaf = f < 0
+        if at_leaf.all():
+            break
+        fx = X[row_idx, np.where(at_leaf, 0, f)]
+        go_left = fx <= thr[tree_idx, nodes]
+        step = np.where(go_left, left[tree_idx, nodes], right[tree_idx, nodes])
+        nodes = np.where(at_leaf, nodes, step)
+    # (T, N, n_classes) leaf probabilities, averaged over trees in float32
+    return value[tree_idx, nodes].astype(np.float32).mean(axis=0)
+
+
+def _predict_proba_batch(X):
+    """Return (N, 2) class probabilities for an (N, 5) array via the fastest
+    available backend."""
+    if treelite_predictor is not None:
+        out = treelite_predictor.predict(treelite_runtime.DMatrix(X))
+        # Binary classifiers return the positive-class probability
+        return np.column_stack([1.0 - out, out]) if out.ndim == 1 else out
+    if _numba_walk is not None:
+        return _numba_walk(
+            np.asarray(X, dtype=np.float32),
+            tree_tables["feature"], tree_tables["threshold"],
+            tree_tables["children_left"], tree_tables["children_right"],
+            _nb_value,
+        )
+    if tree_tables is not None:
+        return _tables_predict_proba(np.asarray(X, dtype=np.float32))
+    return model.predict_proba(X)
+
+
+# --- Micro-Batching Worker ---
+# Concurrent requests are queued and folded into a single model.predict call.
+# sklearn's per-call dispatch overhead dominates for batch size 1, so one
+# (N, 5) predict amortizes it across up to BATCH_MAX requests.
+_batch_queue = queue.Queue()
+
+
+def _drain_batch():
+    """Block for one request, then collect more until BATCH_MAX or BATCH_WAIT."""
+    batch = [_batch_queue.get()]
+    deadline = time.monotonic() + BATCH_WAIT
+    while len(batch) < BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_batch_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _batch_worker():
+    # Reusable feature buffer, filled in place each batch. Requests enqueue
+    # plain tuples so the hot path allocates no ndarrays; float32 matches
+    # the dtype sklearn casts to internally anyway.
+    buf = np.empty((BATCH_MAX, 5), dtype=np.float32)
+    while True:
+        batch = _drain_batch()
+        try:
+            for i, (features, _) in enumerate(batch):
+                buf[i] = features
+            # One predict_proba per batch: argmax/max over the (N, 2) proba
+            # array replaces sklearn's per-row Python loop inside predict
+            # and yields an actual confidence instead of the class label
+            proba = _predict_proba_batch(buf[:len(batch)])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            continue
+        labels = proba.argmax(axis=1)
+        confs = proba.max(axis=1)
+        for (_, fut), label, conf in zip(batch, labels, confs):
+            fut.set_result((int(label), round(float(conf), 4)))
+
+
+# Threads do not survive fork(): with gunicorn preload_app this module is
+# imported in the arbiter, so a worker thread started at import would exist
+# only there and every forked worker would block forever on its futures.
+# Each process therefore starts its own worker lazily on first request;
+# first-use init also runs after gevent's monkey-patching, so the queue and
+# futures all sit on the same (patched) primitives within a worker.
+_worker_pid = None
+_init_claim = {}
+
+
+def init_worker():
+    """Start this process's service threads on first use (fork-safe).
+
+    Deliberately lock-free: a lock created at import would be a native
+    OS lock inherited from pre-patch arbiter state, and a greenlet
+    yielding inside it (thread starts block on the patched
+    _started.wait()) would deadlock the worker's only OS thread. The
+    first caller in each process claims initialization via an atomic
+    dict setdefault instead; concurrent callers sleep (a yielding wait)
+    until the claimant publishes _worker_pid, so nobody ever blocks on a
+    pre-fork lock and the batch queue is never swapped out from under an
+    already-enqueued request.
+    """
+    global _worker_pid, _batch_queue, _log_listener
+    pid = os.getpid()
+    if _worker_pid == pid:
+        return
+    ident = threading.get_ident()
+    if _init_claim.setdefault(pid, ident) != ident:
+        # Another request in this process is initializing; wait it out
+        while _worker_pid != pid:
+            time.sleep(0.001)
+        return
+    try:
+        # Rebuild the log queue and handler (any inherited from the parent
+        # reference its dead listener thread) and a fresh batch queue (one
+        # inherited across fork still holds the parent worker's
+        # condition-variable waiter, so puts would notify a dead thread)
+        log_queue = queue.Queue(-1)
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        logger.addHandler(QueueHandler(log_queue))
+        _log_listener = QueueListener(
+            log_queue,
+            RotatingFileHandler("predict.log", maxBytes=10_000_000,
+                                backupCount=3),
+        )
+        _log_listener.start()
+        if model is not None:
+            _batch_queue = queue.Queue()
+            threading.Thread(target=_batch_worker, daemon=True).start()
+        _worker_pid = pid
+    except BaseException:
+        # Release the claim so a later request can retry initialization
+        _init_claim.pop(pid, None)
+        raise
+
+
+# --- Popular-Inputs Pre-Materialization ---
+# Frontend inputs are bounded (RGB 0-255, slider-quantized temp/humidity),
+# so one batched predict at boot over a coarse grid answers exact matches
+# with zero model calls; everything else falls through to the LRU + batch
+# queue as before.
+_warm_cache = {}
+
+
+def _warm_popular_inputs():
+    rgb = range(0, 256, 32)
+    temps = range(15, 46, 5)
+    hums = range(0, 101, 25)
+    combos = [(float(r), float(g), float(b), float(t), float(h))
+              for r in rgb for g in rgb for b in rgb
+              for t in temps for h in hums]
+    proba = _predict_proba_batch(np.array(combos, dtype=np.float32))
+    labels = proba.argmax(axis=1)
+    confs = proba.max(axis=1)
+    for combo, label, conf in zip(combos, labels, confs):
+        # Same 4-decimal rounding as the batch worker, so on-grid and
+        # off-grid requests produce identical payloads
+        _warm_cache[combo] = (int(label), round(float(conf), 4))
+    print(f"✅ Pre-materialized {len(_warm_cache)} grid predictions")
+
+
+if model is not None:
+    _warm_popular_inputs()
+
+
 # --- Helper Functions ---
-def validate_input(data):
-    """Validate prediction input data"""
-    required = {"R", "G", "B", "temperature", "humidity"}
-    if not all(field in data for field in required):
-        return False, "Missing required fields"
+@lru_cache(maxsize=4096)
+def _cached_predict(r, g, b, temp, hum):
+    """Return (label, confidence) for one quantized input tuple, memoized
+    with LRU eviction.
+
+    Temperature and humidity are rounded to 0.1 before lookup, so repeated
+    and near-duplicate requests skip the forest traversal entirely. Cache
+    misses go through the micro-batching queue.
+    """
+    hit = _warm_cache.get((r, g, b, temp, hum))
+    if hit is not None:
+        return hit
+    fut = Future()
+    _batch_queue.put(((r, g, b, temp, hum), fut))
+    return fut.result(timeout=PREDICT_TIMEOUT)
+
+
+def _parse_json():
+    """Parse the request body, via orjson's native parser when installed."""
+    if orjson is None:
+        return request.get_json(silent=True)
+    try:
+        return orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return None
+
+
+def _json_response(payload, status=200):
+    """Serialize a response dict, via orjson when installed."""
+    if orjson is None:
+        return jsonify(payload), status
+    return app.response_class(
+        orjson.dumps(payload), status=status, mimetype="application/json"
+    )
 
+
+# Per-field bounds for the vectorized range check below
+_FIELDS = ("R", "G", "B", "temperature", "humidity")
+_LO = np.array([0, 0, 0, 15, 0], dtype=np.float32)
+_HI = np.array([255, 255, 255, 45, 100], dtype=np.float32)
+_RANGE_ERRORS = (
+    "R value must be 0-255",
+    "G value must be 0-255",
+    "B value must be 0-255",
+    "Temperature must be 15-45°C",
+    "Humidity must be 0-100%",
+)
+
+
+def validate_input(data):
+    """Validate prediction input data with a single vectorized range check"""
     try:
-        if not (0 <= float(data["R"]) <= 255):
-            return False, "R value must be 0-255"
-        if not (0 <= float(data["G"]) <= 255):
-            return False, "G value must be 0-255"
-        if not (0 <= float(data["B"]) <= 255):
-            return False, "B value must be 0-255"
-        if not (15 <= float(data["temperature"]) <= 45):
-            return False, "Temperature must be 15-45°C"
-        if not (0 <= float(data["humidity"]) <= 100):
-            return False, "Humidity must be 0-100%"
-    except ValueError:
+        arr = np.array([data[f] for f in _FIELDS], dtype=np.float32)
+    except KeyError:
+        return False, "Missing required fields"
+    except (TypeError, ValueError):
         return False, "Invalid numeric values"
 
+    in_range = (arr >= _LO) & (arr <= _HI)
+    if not in_range.all():
+        return False, _RANGE_ERRORS[int(np.argmin(in_range))]
+
     return True, ""
 
 
@@ -63,44 +436,45 @@ def validate_input(data):
 @app.route("/predict", methods=["POST"])
 def predict():
     if model is None:
-        return jsonify({"error": "Model not loaded", "status": "unavailable"}), 503
+        return _json_response(
+            {"error": "Model not loaded", "status": "unavailable"}, 503)
 
-    data = request.get_json()
+    init_worker()
+
+    data = _parse_json()
     if not data:
-        return jsonify({"error": "No data provided"}), 400
+        return _json_response({"error": "No data provided"}, 400)
 
     # Validate input
     is_valid, msg = validate_input(data)
     if not is_valid:
-        return jsonify({"error": msg}), 400
+        return _json_response({"error": msg}, 400)
 
     try:
-        # Prepare features
-        features = np.array([
-            [float(data["R"]),
-             float(data["G"]),
-             float(data["B"]),
-             float(data["temperature"]),
-             float(data["humidity"])]
-        ])
-
-        # Make prediction
-        prediction = model.predict(features)
-        result = "Mature" if prediction[0] == 1 else "Immature"
-
-        return jsonify({
+        # Make prediction (cached on the quantized input tuple)
+        label, confidence = _cached_predict(
+            float(data["R"]),
+            float(data["G"]),
+            float(data["B"]),
+            round(float(data["temperature"]), 1),
+            round(float(data["humidity"]), 1)
+        )
+        result = "Mature" if label == 1 else "Immature"
+        logger.debug("predicted %s (%.4f) for %s", result, confidence, data)
+
+        return _json_response({
             "prediction": result,
-            "confidence": float(prediction[0]),
+            "confidence": confidence,
             "status": "success"
         })
 
     except Exception as e:
-        print(f"Prediction error: {str(e)}", file=sys.stderr)
-        return jsonify({
+        logger.error("Prediction error: %s", e)
+        return _json_response({
             "error": "Prediction failed",
             "details": str(e),
             "status": "error"
-        }), 500
+        }, 500)
 
 
 @app.route("/health", methods=["GET"])
@@ -108,6 +482,7 @@ def health_check():
     return jsonify({
         "status": "healthy" if model else "unhealthy",
         "model_loaded": bool(model),
+        "prediction_cache": _cached_predict.cache_info()._asdict(),
         "timestamp": datetime.now().isoformat(),
         "python_version": sys.version,
         "dependencies": {
@@ -132,6 +507,8 @@ def home():
 
 
 # --- Main ---
+# Development entry point only; in production run under gunicorn:
+#   gunicorn -c gunicorn.conf.py backend:app
 if __name__ == "__main__":
     # Print environment info for debugging
     print(f"Starting server with Python {sys.version}")
@@ -0,0 +1,26 @@
+"""Gunicorn configuration for the prediction API.
+
+Flask's built-in server is single-threaded and serializes all requests.
+Run production with:
+
+    gunicorn -c gunicorn.conf.py backend:app
+
+gevent workers give cooperative concurrency for the JSON parsing and
+validation around the model call; the micro-batching worker thread in
+backend.py handles the model call itself, so greenlets yield while a
+batch accumulates.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = "gevent"
+worker_connections = 1000
+
+# Import backend.py (and load the model) once in the arbiter before forking,
+# so workers inherit the forest copy-on-write instead of each loading it.
+# The batch worker and log listener threads are NOT inherited across the
+# fork; backend.init_worker() restarts them per worker on first request,
+# after gevent's monkey-patching has run.
+preload_app = True
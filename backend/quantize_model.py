@@ -0,0 +1,121 @@
+"""One-shot offline script: export the RandomForest as quantized flat arrays.
+
+sklearn stores tree thresholds and leaf values as float64 and its Tree
+__setstate__ rejects narrower dtypes, so the pickle itself cannot be
+shrunk in place. Instead this script flattens every tree into
+structure-of-arrays tables, quantized to:
+
+    feature         int16    split feature index (-2 marks leaves)
+    threshold       float32  split threshold
+    children_left   int32    left child node index (-1 marks leaves)
+    children_right  int32    right child node index
+    value           float16  per-node class probabilities
+
+and saves them to QUANTIZED_FILE. That halves (thresholds) and quarters
+(leaf values) the bytes pulled into cache per tree walk. The backend
+picks the .npz up at startup when present; predictions are verified
+against the original model before writing.
+
+Usage:
+    python quantize_model.py
+"""
+import sys
+
+import joblib
+import numpy as np
+
+MODEL_FILE = "rf_model_maize_maturity.pkl"
+QUANTIZED_FILE = "rf_model_maize_maturity_q.npz"
+N_CHECK = 2000  # random inputs compared against the original model
+
+
+def extract_tables(model):
+    """Flatten model.estimators_ into (n_trees, max_nodes) quantized arrays."""
+    trees = [e.tree_ for e in model.estimators_]
+    max_nodes = max(t.node_count for t in trees)
+    n_classes = model.n_classes_
+
+    feature = np.full((len(trees), max_nodes), -2, dtype=np.int16)
+    threshold = np.zeros((len(trees), max_nodes), dtype=np.float32)
+    children_left = np.full((len(trees), max_nodes), -1, dtype=np.int32)
+    children_right = np.full((len(trees), max_nodes), -1, dtype=np.int32)
+    value = np.zeros((len(trees), max_nodes, n_classes), dtype=np.float16)
+
+    for i, t in enumerate(trees):
+        n = t.node_count
+        feature[i, :n] = t.feature
+        threshold[i, :n] = t.threshold
+        children_left[i, :n] = t.children_left
+        children_right[i, :n] = t.children_right
+        # Normalize leaf counts to probabilities before narrowing to float16
+        v = t.value[:, 0, :].astype(np.float64)
+        totals = v.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        value[i, :n] = v / totals
+
+    return {
+        "feature": feature,
+        "threshold": threshold,
+        "children_left": children_left,
+        "children_right": children_right,
+        "value": value,
+        "max_depth": np.int32(max(t.max_depth for t in trees)),
+    }
+
+
+def predict_from_tables(tables, X):
+    """Reference per-row tree walk over the quantized tables."""
+    feature = tables["feature"]
+    threshold = tables["threshold"]
+    left = tables["children_left"]
+    right = tables["children_right"]
+    value = tables["value"]
+
+    labels = np.empty(X.shape[0], dtype=np.int64)
+    for i, row in enumerate(X):
+        proba = np.zeros(value.shape[2], dtype=np.float32)
+        for t in range(feature.shape[0]):
+            n = 0
+            while left[t, n] != -1:
+                if row[feature[t, n]] <= threshold[t, n]:
+                    n = left[t, n]
+                else:
+                    n = right[t, n]
+            proba += value[t, n]
+        labels[i] = proba.argmax()
+    return labels
+
+
+def main():
+    print(f"Loading {MODEL_FILE}...")
+    model = joblib.load(MODEL_FILE)
+    tables = extract_tables(model)
+
+    # Verify quantization did not change predictions on random valid inputs
+    rng = np.random.default_rng(42)
+    X = np.column_stack([
+        rng.uniform(0, 255, N_CHECK),   # R
+        rng.uniform(0, 255, N_CHECK),   # G
+        rng.uniform(0, 255, N_CHECK),   # B
+        rng.uniform(15, 45, N_CHECK),   # temperature
+        rng.uniform(0, 100, N_CHECK),   # humidity
+    ]).astype(np.float32)
+    expected = model.predict(X)
+    got = predict_from_tables(tables, X)
+    mismatches = int((expected != got).sum())
+    if mismatches:
+        print(f"❌ {mismatches}/{N_CHECK} predictions changed, not saving",
+              file=sys.stderr)
+        sys.exit(1)
+
+    np.savez_compressed(QUANTIZED_FILE, **tables)
+    raw = sum(t.tree_.threshold.nbytes + t.tree_.value.nbytes
+              for t in model.estimators_)
+    quantized = tables["threshold"].nbytes + tables["value"].nbytes
+    print(f"✅ {QUANTIZED_FILE} written "
+          f"({raw} -> {quantized} bytes for thresholds + values, "
+          f"{N_CHECK}/{N_CHECK} predictions verified)")
+
+
+if __name__ == "__main__":
+    main()
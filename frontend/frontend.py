@@ -1,11 +1,32 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageStat
 import pandas as pd
+import csv
+import io
 import os
 import matplotlib.pyplot as plt
 
+
+@st.cache_data
+def make_heatmap(img_bytes):
+    """Build the RGB channel heatmap figure, cached on the image bytes.
+
+    Streamlit reruns the whole script on every widget change; caching
+    here skips the matplotlib render unless a new image is uploaded.
+    The 50x50 downsample is plenty for a color heatmap.
+    """
+    img_np = np.array(Image.open(io.BytesIO(img_bytes)).convert("RGB").resize((50, 50)))
+    fig, axs = plt.subplots(1, 3, figsize=(12, 3))
+    cmap_labels = ['R', 'G', 'B']
+    for i, ax in enumerate(axs):
+        ax.imshow(img_np[:, :, i], cmap='Reds' if i == 0 else 'Greens' if i == 1 else 'Blues')
+        ax.set_title(f"{cmap_labels[i]} Channel", color="#00b4d8")
+        ax.axis("off")
+    return fig
+
 # Page settings
 st.set_page_config(
     page_title="Maize Maturity Predictor",
@@ -48,6 +69,25 @@ st.markdown("""
 st.title("🌽 Maize Maturity Predictor")
 
 HISTORY_FILE = "prediction_history.csv"
+HISTORY_FIELDS = ["R", "G", "B", "Temp", "Humidity", "Prediction"]
+
+
+def append_history(entry):
+    """Append one prediction row to the CSV instead of rewriting the file."""
+    write_header = not os.path.exists(HISTORY_FILE)
+    with open(HISTORY_FILE, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS)
+        if write_header:
+            writer.writeheader()
+        writer.writerow(entry)
+
+# Persistent HTTP session: keep-alive reuses the TCP connection to the
+# backend instead of a fresh handshake per prediction
+if "http" not in st.session_state:
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    st.session_state.http = session
 
 # Load history
 if "history" not in st.session_state:
@@ -70,23 +110,16 @@ else:
         image = Image.open(uploaded_file).convert("RGB")
         st.image(image, caption="🖼️ Uploaded Image", use_column_width=True)
 
-        # Resize and extract
+        # Resize and extract channel means in PIL's C code,
+        # skipping the numpy round-trip
         resized = image.resize((100, 100))
-        img_np = np.array(resized)
-        avg_color = img_np.mean(axis=(0, 1)).astype(int)
-        r, g, b = int(avg_color[0]), int(avg_color[1]), int(avg_color[2])
+        r, g, b = [int(x) for x in ImageStat.Stat(resized).mean]
 
         st.success(f"🎨 Extracted RGB → R: {r}, G: {g}, B: {b}")
 
         # RGB heatmap
         st.subheader("🌈 RGB Heatmap")
-        fig, axs = plt.subplots(1, 3, figsize=(12, 3))
-        cmap_labels = ['R', 'G', 'B']
-        for i, ax in enumerate(axs):
-            ax.imshow(img_np[:, :, i], cmap='Reds' if i == 0 else 'Greens' if i == 1 else 'Blues')
-            ax.set_title(f"{cmap_labels[i]} Channel", color="#00b4d8")
-            ax.axis("off")
-        st.pyplot(fig)
+        st.pyplot(make_heatmap(uploaded_file.getvalue()))
 
 # Environmental data
 st.subheader("🌡️ Environmental Data")
@@ -101,7 +134,9 @@ if st.button("🚀 Predict Maturity"):
         "humidity": hum
     }
     try:
-        response = requests.post("https://maize-prediction-apps.onrender.com", json=data)
+        response = st.session_state.http.post(
+            "https://maize-prediction-apps.onrender.com", json=data, timeout=5
+        )
         result = response.json()
         if "prediction" in result:
             prediction = result["prediction"]
@@ -113,7 +148,7 @@ if st.button("🚀 Predict Maturity"):
                 "Prediction": prediction
             }
             st.session_state.history.append(entry)
-            pd.DataFrame(st.session_state.history).to_csv(HISTORY_FILE, index=False)
+            append_history(entry)
         else:
             st.error(f"⚠️ Error: {result.get('error', 'Unknown error')}")
     except Exception as e:
@@ -122,19 +157,12 @@ if st.button("🚀 Predict Maturity"):
 # History
 if st.session_state.history:
     st.subheader("📜 Prediction History")
-    for i, entry in enumerate(reversed(st.session_state.history), 1):
-        st.markdown(f"""
-        <div style="background-color:#1a1a1a; padding:10px; border-radius:10px; margin-bottom:10px">
-        <strong>#{i}</strong><br>
-        🌈 RGB: ({entry['R']}, {entry['G']}, {entry['B']})<br>
-        🌡️ Temp: {entry['Temp']}°C<br>
-        💧 Humidity: {entry['Humidity']}%<br>
-        🔍 Result: <strong>{entry['Prediction']}</strong>
-        </div>
-        """, unsafe_allow_html=True)
+    # One dataframe widget (newest first) instead of N markdown blocks,
+    # which Streamlit would re-render on every rerun
+    df = pd.DataFrame(st.session_state.history)
+    st.dataframe(df.iloc[::-1], use_container_width=True)
 
     # Export CSV
-    df = pd.DataFrame(st.session_state.history)
     st.download_button(
         label="📥 Download Prediction History",
         data=df.to_csv(index=False),